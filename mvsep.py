@@ -1,5 +1,6 @@
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -7,8 +8,6 @@ import torch.nn.functional as F
 import torchaudio
 from torch.utils.data import Dataset, DataLoader
 from tqdm import tqdm
-from prodigyopt import Prodigy
-import numpy as np
 
 class SpatialAttention(nn.Module):
     def __init__(self, in_channels):
@@ -28,16 +27,32 @@ class SpatialAttention(nn.Module):
 class SEBlock(nn.Module):
     def __init__(self, channels, reduction=4):
         super(SEBlock, self).__init__()
-        self.fc1 = nn.Linear(channels, channels // reduction)
-        self.fc2 = nn.Linear(channels // reduction, channels)
+        # 1x1 convs act directly on the (B, C, 1, 1) pooled tensor, avoiding
+        # the reshapes a Linear-based squeeze would need
+        self.fc1 = nn.Conv2d(channels, channels // reduction, kernel_size=1)
+        self.fc2 = nn.Conv2d(channels // reduction, channels, kernel_size=1)
         self.sigmoid = nn.Sigmoid()
 
     def forward(self, x):
-        se = torch.mean(x, dim=(2, 3), keepdim=True)  # Global average pooling
+        se = F.adaptive_avg_pool2d(x, 1)  # Global average pooling
         se = F.relu(self.fc1(se))
         se = self.fc2(se)
         return x * self.sigmoid(se)
 
+# Dilated conv + BN + spatial attention with a residual connection around it
+class DilatedResBlock(nn.Module):
+    def __init__(self, hidden_size, dilation):
+        super(DilatedResBlock, self).__init__()
+        self.conv = nn.Conv2d(
+            hidden_size, hidden_size, kernel_size=(3, 3),
+            padding=(dilation, dilation), dilation=(dilation, dilation)
+        )
+        self.bn = nn.BatchNorm2d(hidden_size)
+        self.att = SpatialAttention(hidden_size)
+
+    def forward(self, x):
+        return x + self.att(F.relu(self.bn(self.conv(x))))
+
 # U-Net-like CNN architecture
 class UNetCNN(nn.Module):
     def __init__(self, in_channels=2, hidden_size=512, num_layers=5, dilation_rate=2):
@@ -52,40 +67,15 @@ class UNetCNN(nn.Module):
         self.bn1 = nn.BatchNorm2d(hidden_size)
         self.att1 = SpatialAttention(hidden_size)
 
-        # Encoder layers
-        self.encoder_convs = nn.ModuleList()
-        self.encoder_bns = nn.ModuleList()
-        self.encoder_atts = nn.ModuleList()
-        self.dilation_rates = [dilation_rate ** i for i in range(num_layers - 1)]
-        for dilation in self.dilation_rates:
-            conv = nn.Conv2d(
-                hidden_size, hidden_size, kernel_size=(3, 3),
-                padding=(dilation, dilation), dilation=(dilation, dilation)
-            )
-            bn = nn.BatchNorm2d(hidden_size)
-            att = SpatialAttention(hidden_size)
-            self.encoder_convs.append(conv)
-            self.encoder_bns.append(bn)
-            self.encoder_atts.append(att)
+        # Encoder and decoder layers; the skip connections between them keep
+        # the blocks in ModuleLists rather than a single nn.Sequential
+        self.dilation_rates = tuple(dilation_rate ** i for i in range(num_layers - 1))
+        self.encoder_blocks = nn.ModuleList([DilatedResBlock(hidden_size, dilation) for dilation in self.dilation_rates])
+        self.decoder_blocks = nn.ModuleList([DilatedResBlock(hidden_size, dilation) for dilation in reversed(self.dilation_rates)])
 
-        # Decoder layers
-        self.decoder_convs = nn.ModuleList()
-        self.decoder_bns = nn.ModuleList()
-        self.decoder_atts = nn.ModuleList()
-        for dilation in reversed(self.dilation_rates):
-            conv = nn.Conv2d(
-                hidden_size, hidden_size, kernel_size=(3, 3),
-                padding=(dilation, dilation), dilation=(dilation, dilation)
-            )
-            bn = nn.BatchNorm2d(hidden_size)
-            att = SpatialAttention(hidden_size)
-            self.decoder_convs.append(conv)
-            self.decoder_bns.append(bn)
-            self.decoder_atts.append(att)
-
-        # Last layer for instrumental and vocal magnitude
-        self.conv_inst = nn.Conv2d(hidden_size, in_channels, kernel_size=(3, 3), padding=(1, 1))
-        self.conv_vocal = nn.Conv2d(hidden_size, in_channels, kernel_size=(3, 3), padding=(1, 1))
+        # Last layer for instrumental and vocal magnitude; one conv producing
+        # both heads reads the final feature map once instead of twice
+        self.conv_out = nn.Conv2d(hidden_size, 2 * in_channels, kernel_size=(3, 3), padding=(1, 1))
 
     def forward(self, x):
         # First layer
@@ -94,24 +84,16 @@ class UNetCNN(nn.Module):
 
         # Encoder layers
         encoder_outputs = []
-        for conv, bn, att in zip(self.encoder_convs, self.encoder_bns, self.encoder_atts):
-            residual = x
-            x = F.relu(bn(conv(x)))
-            x = att(x)
-            x = x + residual
+        for block in self.encoder_blocks:
+            x = block(x)
             encoder_outputs.append(x)
 
         # Decoder layers
-        for i, (conv, bn, att) in enumerate(zip(self.decoder_convs, self.decoder_bns, self.decoder_atts)):
-            x = x + encoder_outputs[-i-1]  # Skip connection
-            residual = x
-            x = F.relu(bn(conv(x)))
-            x = att(x)
-            x = x + residual
+        for i, block in enumerate(self.decoder_blocks):
+            x = block(x + encoder_outputs[-i-1])  # Skip connection
 
         # Predict instrumental and vocal magnitude
-        inst_mag = self.conv_inst(x)
-        vocal_mag = self.conv_vocal(x)
+        inst_mag, vocal_mag = self.conv_out(x).chunk(2, dim=1)
 
         return inst_mag, vocal_mag
 
@@ -123,23 +105,38 @@ def loss_fn(pred_inst_mag, pred_vocal_mag, target_inst_mag, target_vocal_mag):
 
 # Custom Dataset class
 class MUSDBDataset(Dataset):
-    def __init__(self, root_dir, sample_rate=44100, segment_length=264600, n_fft=4096, hop_length=1024, segment=True):
+    def __init__(self, root_dir, sample_rate=44100, segment_length=264600, segment=True):
         self.root_dir = root_dir
         self.sample_rate = sample_rate
         self.segment_length = segment_length
-        self.n_fft = n_fft
-        self.hop_length = hop_length
         self.segment = segment
         self.tracks = [os.path.join(root_dir, track) for track in os.listdir(root_dir)]
-        self.window = torch.hann_window(n_fft)
+        # One-time pass to record per-track lengths so __getitem__ can decode
+        # only the requested window instead of whole files
+        self.track_frames = []
+        for track_path in self.tracks:
+            inst_info = torchaudio.info(os.path.join(track_path, 'other.wav'))
+            vocal_info = torchaudio.info(os.path.join(track_path, 'vocals.wav'))
+            self.track_frames.append(min(inst_info.num_frames, vocal_info.num_frames))
 
     def __len__(self):
         return len(self.tracks)
 
     def __getitem__(self, idx):
         track_path = self.tracks[idx]
-        instrumental, _ = torchaudio.load(os.path.join(track_path, 'other.wav'))
-        vocal, _ = torchaudio.load(os.path.join(track_path, 'vocals.wav'))
+        num_frames = self.track_frames[idx]
+
+        # Optionally pick a random segment and decode only that window
+        if self.segment and self.segment_length:
+            if num_frames > self.segment_length:
+                start = torch.randint(0, num_frames - self.segment_length, (1,)).item()
+            else:
+                start = 0
+            instrumental, _ = torchaudio.load(os.path.join(track_path, 'other.wav'), frame_offset=start, num_frames=self.segment_length)
+            vocal, _ = torchaudio.load(os.path.join(track_path, 'vocals.wav'), frame_offset=start, num_frames=self.segment_length)
+        else:
+            instrumental, _ = torchaudio.load(os.path.join(track_path, 'other.wav'))
+            vocal, _ = torchaudio.load(os.path.join(track_path, 'vocals.wav'))
 
         # Ensure both signals have the same number of channels
         if instrumental.shape[0] != 2 or vocal.shape[0] != 2:
@@ -150,43 +147,71 @@ class MUSDBDataset(Dataset):
         instrumental = instrumental[:, :min_length]
         vocal = vocal[:, :min_length]
 
+        # Pad short tracks up to the segment length
+        if self.segment and self.segment_length and min_length < self.segment_length:
+            instrumental = F.pad(instrumental, (0, self.segment_length - min_length))
+            vocal = F.pad(vocal, (0, self.segment_length - min_length))
+
         # Create the mixture by summing instrumental and vocal
         mixture = instrumental + vocal
 
-        # Convert to spectrograms with Hann window
-        mixture_spec = torch.stft(mixture, n_fft=self.n_fft, hop_length=self.hop_length, window=self.window, return_complex=True)
-        instrumental_spec = torch.stft(instrumental, n_fft=self.n_fft, hop_length=self.hop_length, window=self.window, return_complex=True)
-        vocal_spec = torch.stft(vocal, n_fft=self.n_fft, hop_length=self.hop_length, window=self.window, return_complex=True)
-
-        # Convert to magnitude spectrograms
-        mixture_spec = torch.abs(mixture_spec)
-        instrumental_spec = torch.abs(instrumental_spec)
-        vocal_spec = torch.abs(vocal_spec)
-
-        # Optionally segment the signals
-        if self.segment and self.segment_length:
-            if mixture_spec.shape[2] >= self.segment_length // self.hop_length:
-                start = torch.randint(0, mixture_spec.shape[2] - self.segment_length // self.hop_length, (1,))
-                mixture_spec = mixture_spec[:, :, start:start + self.segment_length // self.hop_length]
-                instrumental_spec = instrumental_spec[:, :, start:start + self.segment_length // self.hop_length]
-                vocal_spec = vocal_spec[:, :, start:start + self.segment_length // self.hop_length]
-            else:
-                mixture_spec = F.pad(mixture_spec, (0, self.segment_length // self.hop_length - mixture_spec.shape[2]))
-                instrumental_spec = F.pad(instrumental_spec, (0, self.segment_length // self.hop_length - instrumental_spec.shape[2]))
-                vocal_spec = F.pad(vocal_spec, (0, self.segment_length // self.hop_length - vocal_spec.shape[2]))
+        return mixture, instrumental, vocal
 
-        return mixture_spec, instrumental_spec, vocal_spec, mixture, instrumental, vocal
+# On-device STFT front end. Registering the Hann window as a buffer keeps it
+# resident on the device instead of being rebuilt or copied per call.
+class STFTPreprocessor(nn.Module):
+    def __init__(self, n_fft=4096, hop_length=1024):
+        super(STFTPreprocessor, self).__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.register_buffer('window', torch.hann_window(n_fft))
+
+    def forward(self, waves):
+        # Batch all channels through a single STFT call: (B, C, T) -> (B*C, T) -> (B, C, F, T)
+        batch, channels, length = waves.shape
+        specs = torch.stft(waves.reshape(batch * channels, length), n_fft=self.n_fft, hop_length=self.hop_length, window=self.window, return_complex=True)
+        return specs.reshape(batch, channels, specs.shape[1], specs.shape[2])
+
+# Background writer so checkpoint serialization doesn't stall the training loop
+_save_pool = ThreadPoolExecutor(max_workers=1)
+
+def _cpu_copy(obj):
+    # Snapshot tensors to CPU so the background save never races the next step
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {key: _cpu_copy(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(value) for value in obj)
+    return obj
 
 # Training function
-def train(model, dataloader, optimizer, scheduler, loss_fn, device, epochs, checkpoint_steps, checkpoint_path=None):
+def train(model, dataloader, optimizer, scheduler, loss_fn, device, epochs, checkpoint_steps, checkpoint_path=None, n_fft=4096, hop_length=1024, grad_accum_steps=1):
     model.to(device)
+    preprocessor = STFTPreprocessor(n_fft, hop_length).to(device)
+    # Checkpoints always use the plain module's state dict, even when the
+    # model is wrapped by torch.compile
+    base_model = getattr(model, '_orig_mod', model)
+    # bf16 keeps fp32's exponent range, so mixed precision needs no GradScaler
+    use_amp = device.type == 'cuda' and torch.cuda.is_bf16_supported()
     step = 0
     avg_loss = 0.0
     loss_log = []
+    pending_save = None
+    pending_losses = []
+    log_interval = 10
+
+    def flush_pending_losses():
+        # One device sync for the whole buffer instead of one per step
+        nonlocal avg_loss
+        new_losses = torch.stack(pending_losses).tolist()
+        avg_loss = (avg_loss * (step - len(new_losses)) + sum(new_losses)) / step
+        loss_log.extend(new_losses)
+        pending_losses.clear()
 
     if checkpoint_path:
         checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=True)
-        model.load_state_dict(checkpoint['model_state_dict'])
+        base_model.load_state_dict(checkpoint['model_state_dict'])
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         step = checkpoint['step']
         avg_loss = checkpoint['avg_loss']
@@ -198,20 +223,40 @@ def train(model, dataloader, optimizer, scheduler, loss_fn, device, epochs, chec
 
     model.train()
     for epoch in range(epochs):
-        for mixture_spec, instrumental_spec, vocal_spec, _, _, _ in dataloader:
-            mixture_spec = mixture_spec.to(device)
-            instrumental_spec = instrumental_spec.to(device)
-            vocal_spec = vocal_spec.to(device)
-
-            target_inst_mag = instrumental_spec
-            target_vocal_mag = vocal_spec
-
-            optimizer.zero_grad()
-
-            pred_inst_mag, pred_vocal_mag = model(mixture_spec)
-            loss = loss_fn(pred_inst_mag, pred_vocal_mag, target_inst_mag, target_vocal_mag)
-
-            loss.backward()
+        for mixture, instrumental, vocal in dataloader:
+            mixture = mixture.to(device, non_blocking=True)
+            instrumental = instrumental.to(device, non_blocking=True)
+            vocal = vocal.to(device, non_blocking=True)
+
+            # Convert to magnitude spectrograms on device, all signals in one batched STFT
+            waves = torch.cat([mixture, instrumental, vocal], dim=0)
+            specs = torch.abs(preprocessor(waves))
+            mixture_spec, instrumental_spec, vocal_spec = specs.chunk(3, dim=0)
+
+            # Normalize input and targets with the mixture's per-sample
+            # statistics, so the scale stripped from the input is also
+            # stripped from what the network must predict; var_mean does both
+            # reductions in a single pass
+            var, mean = torch.var_mean(mixture_spec, dim=(2, 3), keepdim=True, unbiased=False)
+            inv_std = torch.rsqrt(var + 1e-8)
+            mixture_spec = (mixture_spec - mean) * inv_std
+            mixture_spec = mixture_spec.contiguous(memory_format=torch.channels_last)
+            if use_amp:
+                # Cast only the conv-trunk input; the STFT, normalization and
+                # loss stay in fp32, and this halves the activation footprint
+                mixture_spec = mixture_spec.to(torch.bfloat16)
+
+            target_inst_mag = (instrumental_spec - mean) * inv_std
+            target_vocal_mag = (vocal_spec - mean) * inv_std
+
+            with torch.autocast(device_type='cuda', dtype=torch.bfloat16, enabled=use_amp):
+                pred_inst_mag, pred_vocal_mag = model(mixture_spec)
+
+            # Compute the loss in fp32 for numerical stability
+            loss = loss_fn(pred_inst_mag.float(), pred_vocal_mag.float(), target_inst_mag, target_vocal_mag)
+
+            # Scale the loss so gradients average over the accumulation window
+            (loss / grad_accum_steps).backward()
 
             # Check for NaN values in gradients
             has_nan = False
@@ -223,29 +268,42 @@ def train(model, dataloader, optimizer, scheduler, loss_fn, device, epochs, chec
             if has_nan:
                 if step > 0:
                     print("NaN detected in gradients, skipping this batch.")
-                optimizer.zero_grad()
+                optimizer.zero_grad(set_to_none=True)
                 continue
 
-            optimizer.step()
-            scheduler.step()
+            # Step only once per accumulation window to simulate a larger batch
+            if (step + 1) % grad_accum_steps == 0:
+                optimizer.step()
+                scheduler.step()
+                optimizer.zero_grad(set_to_none=True)
 
-            avg_loss = (avg_loss * step + loss.item()) / (step + 1)
-            loss_log.append(loss.item())
+            # Buffer the loss on device; calling .item() every step would
+            # force a CPU-GPU sync on the hot path
+            pending_losses.append(loss.detach())
             step += 1
             progress_bar.update(1)
-            desc = f"Epoch {epoch+1}/{epochs} - Loss: {loss.item():.4f} - Avg Loss: {avg_loss:.4f}"
+
+            if step % log_interval == 0 or step % checkpoint_steps == 0:
+                flush_pending_losses()
+                progress_bar.set_description(f"Epoch {epoch+1}/{epochs} - Loss: {loss_log[-1]:.4f} - Avg Loss: {avg_loss:.4f}")
 
             if step % checkpoint_steps == 0:
-                torch.save({
+                # Keep at most one save in flight, then hand the snapshot to
+                # the background writer and keep training
+                if pending_save is not None:
+                    pending_save.result()
+                pending_save = _save_pool.submit(torch.save, {
                     'step': step,
-                    'model_state_dict': model.state_dict(),
-                    'optimizer_state_dict': optimizer.state_dict(),
+                    'model_state_dict': _cpu_copy(base_model.state_dict()),
+                    'optimizer_state_dict': _cpu_copy(optimizer.state_dict()),
                     'avg_loss': avg_loss,
-                    'loss_log': loss_log
+                    'loss_log': list(loss_log)
                 }, f"checkpoint_step_{step}.pt")
 
-            progress_bar.set_description(desc)
-
+    if pending_losses:
+        flush_pending_losses()
+    if pending_save is not None:
+        pending_save.result()
     torch.save({'loss_log': loss_log}, 'loss_log.pt')
     progress_bar.close()
 
@@ -255,6 +313,8 @@ def inference(model, checkpoint_path, input_wav_path, output_instrumental_path,
     model.load_state_dict(checkpoint['model_state_dict'], strict=False)
     model.eval()
     model.to(device)
+    model = model.to(memory_format=torch.channels_last)
+    use_amp = torch.device(device).type == 'cuda' and torch.cuda.is_bf16_supported()
 
     input_audio, sr = torchaudio.load(input_wav_path)
     if input_audio.shape[0] != 2:
@@ -262,62 +322,80 @@ def inference(model, checkpoint_path, input_wav_path, output_instrumental_path,
     input_audio = input_audio.to(device)
 
     total_length = input_audio.shape[1]
-    num_chunks = (total_length - overlap) // (chunk_size - overlap)
+    stride = chunk_size - overlap
     instrumentals = torch.zeros_like(input_audio)
     vocals = torch.zeros_like(input_audio)
 
-    cross_fade_length = overlap // 2
-    window = torch.hann_window(n_fft).to(device)
+    preprocessor = STFTPreprocessor(n_fft, hop_length).to(device)
+    # Overlap-add window: linear ramps spanning the overlap at both ends and
+    # flat in the middle, so the opposing ramps of neighbouring chunks sum to 1
+    ramp = torch.linspace(0, 1, overlap, device=device)
+    ola_window = torch.ones(chunk_size, device=device)
+    ola_window[:overlap] = ramp
+    ola_window[chunk_size - overlap:] = ramp.flip(0)
+
+    # Cut the input into overlapping chunks and batch every channel of every
+    # chunk through a single STFT call
+    if total_length >= chunk_size:
+        chunks = input_audio.unfold(1, chunk_size, stride).permute(1, 0, 2).contiguous()
+        num_chunks = chunks.shape[0]
+        specs = preprocessor(chunks)
+        mags = torch.abs(specs)
+        phases = torch.angle(specs)
+
+        # Normalize every chunk the same way as in training
+        var, mean = torch.var_mean(mags, dim=(2, 3), keepdim=True, unbiased=False)
+        inv_std = torch.rsqrt(var + 1e-8)
+        mags_normalized = (mags - mean) * inv_std
+        mags_normalized = mags_normalized.contiguous(memory_format=torch.channels_last)
+        if use_amp:
+            # The STFT stays fp32; only the conv trunk sees bf16
+            mags_normalized = mags_normalized.to(torch.bfloat16)
+
+        # Run the model and inverse STFT over bounded micro-batches of chunks,
+        # so activation memory stays flat no matter how long the track is
+        micro_batch_size = 8
+        inst_chunks = torch.empty_like(chunks)
+        for b in range(0, num_chunks, micro_batch_size):
+            batch = slice(b, b + micro_batch_size)
+
+            with torch.inference_mode(), torch.autocast(device_type='cuda', dtype=torch.bfloat16, enabled=use_amp):
+                pred_inst_mag, pred_vocal_mag = model(mags_normalized[batch])
+
+            # Bring the prediction back to the raw magnitude scale, subtract
+            # it from the mixture magnitude, then rebuild the complex
+            # spectrogram in one kernel with torch.polar
+            pred_vocal_mag = pred_vocal_mag.float() / inv_std[batch] + mean[batch]
+            inst_spec_mag = torch.clamp(mags[batch] - pred_vocal_mag, min=0.0)
+            inst_specs = torch.polar(inst_spec_mag, phases[batch])
+
+            # Batched inverse STFT, mirroring the forward transform
+            n = inst_specs.shape[0]
+            inst_chunk = torch.istft(inst_specs.reshape(n * 2, inst_specs.shape[2], inst_specs.shape[3]), n_fft=n_fft, hop_length=hop_length, window=preprocessor.window, length=chunk_size, return_complex=False)
+            inst_chunks[batch] = inst_chunk.reshape(n, 2, chunk_size)
+
+        # Compute vocals by subtracting the instrumental from the original input
+        vocal_chunks = chunks - inst_chunks
+    else:
+        # Shorter than one chunk: nothing to process, matching the old loop
+        num_chunks = 0
 
     with tqdm(total=num_chunks, desc="Processing audio") as pbar:
-        for i in range(0, total_length - chunk_size + 1, chunk_size - overlap):
-            chunk = input_audio[:, i:i + chunk_size]
-
-            chunk_spec = torch.stft(chunk, n_fft=n_fft, hop_length=hop_length, window=window, return_complex=True)
-            chunk_mag = torch.abs(chunk_spec)
-            chunk_phase = torch.angle(chunk_spec)
-
-            chunk_mag = chunk_mag.unsqueeze(0)
-
-            with torch.no_grad():
-                pred_inst_mag, pred_vocal_mag = model(chunk_mag)
-
-            pred_inst_mag = pred_inst_mag.squeeze(0)
-            pred_vocal_mag = pred_vocal_mag.squeeze(0)
-
-            # Subtract the predicted vocal magnitude from the mixture magnitude
-            inst_spec_mag = chunk_mag - pred_vocal_mag
-            inst_spec_mag = torch.clamp(inst_spec_mag, min=0.0)
-
-            inst_spec = inst_spec_mag * torch.exp(1j * chunk_phase)
-
-            # Ensure inst_spec has the correct shape for istft
-            inst_spec = inst_spec.squeeze(0)
-
-            inst_chunk = torch.istft(inst_spec, n_fft=n_fft, hop_length=hop_length, window=window, length=chunk_size, return_complex=False)
-
-            # Compute vocals by subtracting the instrumental from the original input
-            vocal_chunk = chunk - inst_chunk
-
-            if i == 0:
-                # For the first chunk, don't apply cross-fading
-                instrumentals[:, i:i + chunk_size] = inst_chunk
-                vocals[:, i:i + chunk_size] = vocal_chunk
-            else:
-                # Apply cross-fading for subsequent chunks
-                fade_in = torch.linspace(0, 1, cross_fade_length).to(device)
-                fade_out = torch.linspace(1, 0, cross_fade_length).to(device)
-
-                inst_chunk[:, :cross_fade_length] *= fade_in
-                instrumentals[:, i:i + cross_fade_length] *= fade_out
-                instrumentals[:, i:i + cross_fade_length] += inst_chunk[:, :cross_fade_length]
-
-                vocal_chunk[:, :cross_fade_length] *= fade_in
-                vocals[:, i:i + cross_fade_length] *= fade_out
-                vocals[:, i:i + cross_fade_length] += vocal_chunk[:, :cross_fade_length]
-
-            instrumentals[:, i + cross_fade_length:i + chunk_size] = inst_chunk[:, cross_fade_length:]
-            vocals[:, i + cross_fade_length:i + chunk_size] = vocal_chunk[:, cross_fade_length:]
+        for k in range(num_chunks):
+            i = k * stride
+
+            # Window each chunk once and sum it into the output; the first and
+            # last chunks keep full level at the track edges
+            w = ola_window
+            if k == 0:
+                w = w.clone()
+                w[:overlap] = 1.0
+            if k == num_chunks - 1:
+                w = w.clone()
+                w[chunk_size - overlap:] = 1.0
+
+            instrumentals[:, i:i + chunk_size] += inst_chunks[k] * w
+            vocals[:, i:i + chunk_size] += vocal_chunks[k] * w
 
             pbar.update(1)
 
@@ -335,6 +413,7 @@ def main():
     parser.add_argument('--epochs', type=int, default=10000, help='Number of epochs to train')
     parser.add_argument('--batch_size', type=int, default=1, help='Batch size')
     parser.add_argument('--learning_rate', type=float, default=1.0, help='Learning rate')
+    parser.add_argument('--grad_accum_steps', type=int, default=1, help='Number of batches to accumulate gradients over before stepping')
     parser.add_argument('--checkpoint_steps', type=int, default=2000, help='Save checkpoint every X steps')
     parser.add_argument('--checkpoint_path', type=str, default=None, help='Path to checkpoint to resume from')
     parser.add_argument('--input_wav', type=str, default=None, help='Path to input WAV file for inference')
@@ -342,6 +421,7 @@ def main():
     parser.add_argument('--output_vocal', type=str, default='output_vocal.wav', help='Path to output vocal WAV file')
     parser.add_argument('--segment_length', type=int, default=264600, help='Segment length for training')
     parser.add_argument('--num_layers', type=int, default=5, help='Number of layers in the CNN model')
+    parser.add_argument('--compile', action='store_true', help='Compile the model with torch.compile')
     parser.add_argument('--n_fft', type=int, default=4096, help='Number of FFT bins for STFT')
     parser.add_argument('--hop_length', type=int, default=1024, help='Hop length for STFT')
     args = parser.parse_args()
@@ -349,16 +429,25 @@ def main():
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     model = UNetCNN(in_channels=2, hidden_size=256, num_layers=args.num_layers)
-    optimizer = Prodigy(model.parameters(), lr=args.learning_rate, weight_decay=0.0)
+    # NHWC lets cuDNN pick tensor-core kernels for the convs without layout transposes
+    model = model.to(memory_format=torch.channels_last)
+
+    if args.compile:
+        model = torch.compile(model, mode="default")
 
     if args.train:
-        train_dataset = MUSDBDataset(root_dir=args.data_dir, segment_length=args.segment_length, n_fft=args.n_fft, hop_length=args.hop_length, segment=True)
-        train_dataloader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=8, pin_memory=False)
+        # Import the optimizer lazily so inference doesn't pay for it at startup
+        from prodigyopt import Prodigy
+        optimizer = Prodigy(model.parameters(), lr=args.learning_rate, weight_decay=0.0)
+
+        train_dataset = MUSDBDataset(root_dir=args.data_dir, segment_length=args.segment_length, segment=True)
+        train_dataloader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=8, pin_memory=True, persistent_workers=True, prefetch_factor=4)
 
-        total_steps = args.epochs * len(train_dataloader)
+        # The scheduler steps once per accumulation window, not per batch
+        total_steps = args.epochs * len(train_dataloader) // args.grad_accum_steps
         scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=total_steps)
 
-        train(model, train_dataloader, optimizer, scheduler, loss_fn, device, args.epochs, args.checkpoint_steps, checkpoint_path=args.checkpoint_path)
+        train(model, train_dataloader, optimizer, scheduler, loss_fn, device, args.epochs, args.checkpoint_steps, checkpoint_path=args.checkpoint_path, n_fft=args.n_fft, hop_length=args.hop_length, grad_accum_steps=args.grad_accum_steps)
     elif args.infer:
         if args.input_wav is None:
             print("Please specify an input WAV file for inference using --input_wav")